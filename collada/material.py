@@ -27,14 +27,32 @@ from collada.common import DaeIncompleteError, DaeBrokenRefError, \
     DaeMalformedError, DaeUnsupportedError
 from collada.util import falmostEqual, BytesIO
 
-try:
-    from PIL import Image as pil
-except BaseException:
-    pil = None
-
 # internally used constant
 _FAILED = 'failed'
 
+# PIL is imported on first use by _getPIL() so that loading documents
+# without touching images does not pay for it
+_pil = _FAILED
+
+
+def _getPIL():
+    """Import PIL's Image module on first use, returning None if unavailable."""
+    global _pil
+    if _pil is _FAILED:
+        try:
+            from PIL import Image as _pil
+        except BaseException:
+            _pil = None
+    return _pil
+
+
+def __getattr__(name):
+    # keeps the public `pil` attribute (PIL's Image module, or None if
+    # PIL is not installed) without importing PIL up front
+    if name == 'pil':
+        return _getPIL()
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
 
 class DaeMissingSampler2D(Exception):
     """Raised when a <texture> tag references a texture without a sampler."""
@@ -90,7 +108,7 @@ class CImage(DaeObject):
         return self._data
 
     def getImage(self):
-        if pil is None or self._pilimage is _FAILED:
+        if _getPIL() is None or self._pilimage is _FAILED:
             return None
         if self._pilimage:
             return self._pilimage
@@ -100,7 +118,7 @@ class CImage(DaeObject):
                 self._pilimage = _FAILED
                 return None
             try:
-                self._pilimage = pil.open(BytesIO(data))
+                self._pilimage = _pil.open(BytesIO(data))
                 self._pilimage.load()
             except IOError:
                 self._pilimage = _FAILED
@@ -1,4 +1,6 @@
 import os
+import subprocess
+import sys
 
 import collada
 from collada.util import unittest
@@ -127,6 +129,25 @@ class TestMaterial(unittest.TestCase):
             self.assertTupleEqual(numpy_uints.shape, (512, 512, 3))
             self.assertTupleEqual(numpy_uints.shape, (512, 512, 3))
 
+    def test_pil_attribute(self):
+        try:
+            from PIL import Image as pil
+        except ImportError:
+            pil = None
+
+        # PIL is loaded lazily, but the public attribute still holds
+        # PIL's Image module, or None if PIL is not installed
+        self.assertIs(collada.material.pil, pil)
+
+    def test_pil_not_imported(self):
+        # use a fresh interpreter, as other tests may have imported PIL
+        code = 'import sys, collada; print("PIL" in sys.modules)'
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(collada.__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        output = subprocess.check_output([sys.executable, '-c', code], env=env)
+        self.assertEqual(output.strip(), b'False')
+
     def test_surface_saving(self):
         cimage = collada.material.CImage("mycimage", "./whatever.tga", self.dummy)
         surface = collada.material.Surface("mysurface", cimage)
@@ -1,4 +1,5 @@
 import functools
+import sys
 
 COLLADA_NS = 'http://www.collada.org/2005/11/COLLADASchema'
 HAVE_LXML = False
@@ -50,7 +51,7 @@ else:
 
         def __call__(self, tag, *children, **attrib):
             if self._namespace is not None and tag[0] != '{':
-                tag = self._namespace + tag
+                tag = sys.intern(self._namespace + tag)
 
             elem = etree.Element(tag, attrib)
             for item in children:
@@ -68,7 +69,15 @@ else:
             return elem
 
         def __getattr__(self, tag):
-            return functools.partial(self, tag)
+            if tag.startswith('__'):
+                raise AttributeError(tag)
+            fulltag = tag
+            if self._namespace is not None and tag[0] != '{':
+                fulltag = self._namespace + tag
+            maker = functools.partial(self, sys.intern(fulltag))
+            # cache on the instance so later lookups bypass __getattr__
+            self.__dict__[tag] = maker
+            return maker
 
     E = ElementMaker()
 
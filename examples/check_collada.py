@@ -6,7 +6,7 @@ print('Attempting to load file %s' % sys.argv[1])
 
 try:
     col = collada.Collada(sys.argv[1],
-                          ignore=[collada.DaeUnsupportedError, collada.DaeBrokenRefError])
+                          ignore=[collada.common.DaeUnsupportedError, collada.DaeBrokenRefError])
 except BaseException:
     traceback.print_exc()
     print()
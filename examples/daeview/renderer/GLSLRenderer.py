@@ -101,14 +101,7 @@ class GLSLRenderer:
                                     tex_id = self.textures[colladaimage.id]
                                 else:
                                     # If not - create new texture
-                                    try:
-                                        # get image meta-data
-                                        # (dimensions) and data
-                                        (ix, iy, tex_data) = (img.size[0], img.size[1], img.tobytes("raw", "RGBA", 0, -1))
-                                    except (SystemError, ValueError):
-                                        # has no alpha channel,
-                                        # synthesize one
-                                        (ix, iy, tex_data) = (img.size[0], img.size[1], img.tobytes("raw", "RGBX", 0, -1))
+                                    (ix, iy, tex_data) = glutils.decodeImage(colladaimage, img)
                                     # generate a texture ID
                                     tid = GLuint()
                                     glGenTextures(1, ctypes.byref(tid))
@@ -121,7 +114,7 @@ class GLSLRenderer:
                                     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
                                     # copy the texture into the
                                     # current texture ID
-                                    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, tex_data)
+                                    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, tex_data.ctypes.data)
 
                                     self.textures[colladaimage.id] = tex_id
                             else:
@@ -138,60 +131,46 @@ class GLSLRenderer:
                                 shininess = value
 
                     # use primitive-specific ways to get triangles
-                    prim_type = type(prim).__name__
-                    if prim_type == 'BoundTriangleSet':
-                        triangles = prim
-                    elif prim_type == 'BoundPolylist':
-                        triangles = prim.triangleset()
-                    else:
-                        print('Unsupported mesh used:', prim_type)
-                        triangles = None
+                    triangles = glutils.getTriangles(prim)
 
                     if triangles is not None:
                         triangles.generateNormals()
-                        # We will need flat lists for VBO (batch) initialization
-                        vertices = triangles.vertex.flatten().tolist()
-                        batch_len = len(vertices) // 3
-                        indices = triangles.vertex_index.flatten().tolist()
-                        normals = triangles.normal.flatten().tolist()
-
-                        batch = pyglet.graphics.Batch()
+                        vertex = triangles.vertex
+                        batch_len = len(vertex)
 
                         # Track maximum and minimum Z coordinates
-                        # (every third element) in the flattened
-                        # vertex list
-                        ma = max(vertices[2::3])
-                        if ma > self.z_max:
-                            self.z_max = ma
+                        # while the vertex array is still an ndarray
+                        if batch_len > 0:
+                            zs = vertex[:, 2]
+                            self.z_max = max(self.z_max, float(zs.max()))
+                            self.z_min = min(self.z_min, float(zs.min()))
 
-                        mi = min(vertices[2::3])
-                        if mi < self.z_min:
-                            self.z_min = mi
+                        batch = pyglet.graphics.Batch()
 
+                        # We will need flat lists for VBO (batch)
+                        # initialization. ravel() avoids the extra
+                        # copy flatten() makes before tolist().
                         if tex_id is not None:
 
-                            # This is probably the most inefficient
-                            # way to get correct texture coordinate
-                            # list (uv). I am sure that I just do not
-                            # understand enough how texture
-                            # coordinates and corresponding indexes
-                            # are related to the vertices and vertex
-                            # indices here, but this is what I found
-                            # to work. Feel free to improve the way
-                            # texture coordinates (uv) are collected
-                            # for batch.add_indexed() invocation.
-                            uv = [[0.0, 0.0]] * batch_len
-                            for t in triangles:
-                                nidx = 0
-                                texcoords = t.texcoords[0]
-                                for vidx in t.indices:
-                                    uv[vidx] = texcoords[nidx].tolist()
-                                    nidx += 1
-                            # Flatten the uv list
-                            uv = [item for sublist in uv for item in sublist]
+                            # Texture coordinates are indexed
+                            # separately from the vertices, so a
+                            # vertex on a texture seam has different
+                            # coordinates in different triangles.
+                            # Give each distinct (vertex, texcoord)
+                            # pair its own index for
+                            # batch.add_indexed() invocation.
+                            pairs = numpy.column_stack((triangles.vertex_index.ravel(),
+                                                        triangles.texcoord_indexset[0].ravel()))
+                            corners, corner_index = numpy.unique(pairs, axis=0, return_inverse=True)
+                            vertices = vertex[corners[:, 0]].ravel().tolist()
+                            normals = triangles.normal[corners[:, 0]].ravel().tolist()
+                            indices = corner_index.ravel().tolist()
+                            # pyglet copies attribute data element by
+                            # element, which is fastest from a list
+                            uv = triangles.texcoordset[0][corners[:, 1]].ravel().tolist()
 
                             # Create textured batch
-                            batch.add_indexed(batch_len,
+                            batch.add_indexed(len(corners),
                                               GL_TRIANGLES,
                                               None,
                                               indices,
@@ -199,6 +178,10 @@ class GLSLRenderer:
                                               ('n3f/static', normals),
                                               ('t2f/static', uv))
                         else:
+                            vertices = vertex.ravel().tolist()
+                            indices = triangles.vertex_index.ravel().tolist()
+                            normals = triangles.normal.ravel().tolist()
+
                             # Create colored batch
                             batch.add_indexed(batch_len,
                                               GL_TRIANGLES,
@@ -212,6 +195,10 @@ class GLSLRenderer:
                         self.batch_list.append(
                             (batch, shader_prog, tex_id, diff_color,
                              spec_color, amb_color, shininess))
+
+        # Group batches sharing a shader and texture, so render() has
+        # to switch GL state as rarely as possible
+        self.batch_list.sort(key=lambda b: (id(b[1]), -1 if b[2] is None else b[2]))
         print('done. Ready to render.')
 
     def render(self, rotate_x, rotate_y, rotate_z):
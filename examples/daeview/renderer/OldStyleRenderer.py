@@ -10,6 +10,39 @@ from pyglet.gl import *
 import ctypes
 from . import glutils
 
+# glMaterialfv copies the values, so one default array can be shared
+# by every primitive instead of being allocated for each of them
+_DEFAULT_DIFFUSE = (GLfloat * 4)(0.3, 0.3, 0.3, 0.0)
+
+
+def colorArray(value):
+    """Return a GLfloat array for a color tuple or NumPy array"""
+    if isinstance(value, numpy.ndarray):
+        # share the float32 data instead of unpacking it element by
+        # element into a new ctypes array
+        data = numpy.require(value, dtype=numpy.float32, requirements=['C', 'W'])
+        return (GLfloat * data.size).from_buffer(data)
+    return (GLfloat * len(value))(*value)
+
+
+# Display lists compiled for each bound geometry, shared by all
+# renderer instances: key -> [list id, refcount, z min, z max, geometry]
+_DISPLAY_LIST_CACHE = {}
+
+# Textures created for each collada image, shared along with the display
+# lists that bind them: id(image) -> [texture id, refcount, image]
+#
+# Both caches hold GL object names, so they assume every renderer draws
+# into the same GL context. daeview opens a single window, and so a
+# single context, per process.
+_TEXTURE_CACHE = {}
+
+
+def geometryKey(geom):
+    """Identify a bound geometry by its source, transform and materials"""
+    materials = tuple(sorted((symbol, id(node.target)) for (symbol, node) in geom.materialnodebysymbol.items()))
+    return (id(geom.original), numpy.asarray(geom.matrix).tobytes(), materials)
+
 
 class OldStyleRenderer:
 
@@ -19,7 +52,11 @@ class OldStyleRenderer:
         # to calculate model boundary
         self.z_max = -100000.0
         self.z_min = 100000.0
+        self.geomkeys = []
         self.textures = {}
+        self.texkeys = []
+        self.effects = {}
+        self.buffers = []
 
         glShadeModel(GL_SMOOTH)  # Enable Smooth Shading
         glClearColor(0.0, 0.0, 0.0, 0.5)  # Black Background
@@ -39,131 +76,235 @@ class OldStyleRenderer:
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
 
-        # create one display list
-        print('Creating display list...')
+        # create one display list per geometry
+        print('Creating display lists...')
         print('It could take some time. Please be patient :-) .')
+        self.createTextures()
+        self.drawPrimitives()
+        # and one display list calling all of them
         self.displist = glGenLists(1)
-        # compile the display list, store a triangle in it
         glNewList(self.displist, GL_COMPILE)
-        self.drawPrimitives()
+        for key in self.geomkeys:
+            glCallList(_DISPLAY_LIST_CACHE[key][0])
         glEndList()
+        # the model boundary is final now, so the model and light
+        # placement can be computed once instead of every frame
+        self.z_offset = self.z_min - (self.z_max - self.z_min) * 3
+        self.light_pos = (GLfloat * 3)(100.0, 100.0, 100.0 * -self.z_offset)
         print('done. Ready to render.')
 
+    def createTextures(self):
+        """Create GL textures for all images used by the scene materials,
+        reusing the ones already created for the same images"""
+        images = []
+        if self.dae.scene is not None:
+            seen = set()
+            for geom in self.dae.scene.objects('geometry'):
+                for matnode in geom.materialnodebysymbol.values():
+                    effect = matnode.target.effect
+                    for prop in effect.supported:
+                        value = getattr(effect, prop)
+                        if not isinstance(value, collada.material.Map):
+                            continue
+                        colladaimage = value.sampler.surface.image
+                        key = id(colladaimage)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        entry = _TEXTURE_CACHE.get(key)
+                        if entry is not None:
+                            entry[1] += 1
+                            self.texkeys.append(key)
+                            self.textures[colladaimage.id] = entry[0]
+                            continue
+                        # Accessing this attribute forces the
+                        # loading of the image using PIL if
+                        # available. Unless it is already loaded.
+                        if colladaimage.pilimage:  # can read and PIL available
+                            images.append(colladaimage)
+        if not images:
+            return
+
+        # generate all texture IDs at once
+        tids = (GLuint * len(images))()
+        glGenTextures(len(images), tids)
+        for (tex_id, colladaimage) in zip(tids, images):
+            (ix, iy, tex_data) = glutils.decodeImage(colladaimage, colladaimage.pilimage)
+            # make it current
+            glBindTexture(GL_TEXTURE_2D, tex_id)
+            # new textures already use GL_LINEAR magnification and
+            # GL_REPEAT wrapping; only the minification default needs
+            # changing, as it requires mipmaps we do not upload
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            #glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+            # copy the texture into the
+            # current texture ID
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, tex_data.ctypes.data)
+
+            # keep the image alive so its id cannot be reused by
+            # other objects
+            _TEXTURE_CACHE[id(colladaimage)] = [tex_id, 1, colladaimage]
+            self.texkeys.append(id(colladaimage))
+            self.textures[colladaimage.id] = tex_id
+        glBindTexture(GL_TEXTURE_2D, 0)
+
     def drawPrimitives(self):
-        glBegin(GL_TRIANGLES)
+        """Compile a display list for every geometry in the scene, reusing
+        the ones already compiled for the same bound geometry"""
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
 
         if self.dae.scene is not None:
             for geom in self.dae.scene.objects('geometry'):
-                for prim in geom.primitives():
-                    mat = prim.material
-                    diff_color = (GLfloat * 4)(*(0.3, 0.3, 0.3, 0.0))
-                    spec_color = None
-                    shininess = None
-                    amb_color = None
-                    tex_id = None
-                    for prop in mat.effect.supported:
-                        value = getattr(mat.effect, prop)
-                        # it can be a float, a color (tuple) or a Map
-                        # ( a texture )
-                        if isinstance(value, collada.material.Map):
-                            colladaimage = value.sampler.surface.image
-                            # Accessing this attribute forces the
-                            # loading of the image using PIL if
-                            # available. Unless it is already loaded.
-                            img = colladaimage.pilimage
-                            if img:  # can read and PIL available
-                                # See if we already have texture for this image
-                                if colladaimage.id in self.textures:
-                                    tex_id = self.textures[colladaimage.id]
-                                else:
-                                    # If not - create new texture
-                                    try:
-                                        # get image meta-data
-                                        # (dimensions) and data
-                                        (ix, iy, tex_data) = (img.size[0], img.size[1], img.tostring("raw", "RGBA", 0, -1))
-                                    except SystemError:
-                                        # has no alpha channel,
-                                        # synthesize one
-                                        (ix, iy, tex_data) = (img.size[0], img.size[1], img.tostring("raw", "RGBX", 0, -1))
-                                    # generate a texture ID
-                                    tid = GLuint()
-                                    glGenTextures(1, ctypes.byref(tid))
-                                    tex_id = tid.value
-                                    # make it current
-                                    glBindTexture(GL_TEXTURE_2D, tex_id)
-                                    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-                                    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-                                    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-                                    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-                                    #glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
-                                    # copy the texture into the
-                                    # current texture ID
-                                    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, tex_data)
-
-                                    self.textures[colladaimage.id] = tex_id
-                            else:
-                                print('  %s = Texture %s: (not available)' % (
-                                    prop, colladaimage.id))
-                        else:
-                            if prop == 'diffuse' and value is not None:
-                                diff_color = (GLfloat * 4)(*value)
-                            elif prop == 'specular' and value is not None:
-                                spec_color = (GLfloat * 4)(*value)
-                            elif prop == 'ambient' and value is not None:
-                                amb_color = (GLfloat * 4)(*value)
-                            elif prop == 'shininess' and value is not None:
-                                shininess = value
-
-                    # use primitive-specific ways to get triangles
-                    prim_type = type(prim).__name__
-                    if prim_type == 'BoundTriangleSet':
-                        triangles = prim
-                    elif prim_type == 'BoundPolylist':
-                        triangles = prim.triangleset()
-                    else:
-                        print('Unsupported mesh used:', prim_type)
-                        triangles = []
-
-                    if tex_id is not None:
-                        glBindTexture(GL_TEXTURE_2D, tex_id)
-                    else:
-                        glBindTexture(GL_TEXTURE_2D, 0)
-
-                    # add triangles to the display list
-                    for t in triangles:
-                        nidx = 0
-                        if tex_id is not None and len(t.texcoords) > 0:
-                            texcoords = t.texcoords[0]
-                        else:
-                            texcoords = None
-
-                        for vidx in t.indices:
-                            if diff_color is not None:
-                                glMaterialfv(GL_FRONT, GL_DIFFUSE, diff_color)
-                            if spec_color is not None:
-                                glMaterialfv(GL_FRONT, GL_SPECULAR, spec_color)
-                            if amb_color is not None:
-                                glMaterialfv(GL_FRONT, GL_AMBIENT, amb_color)
-                            if shininess is not None:
-                                glMaterialfv(GL_FRONT, GL_SHININESS, (GLfloat * 1)(shininess))
-
-                            # if not t.normals is None:
-                            glNormal3fv((GLfloat * 3)(*t.normals[nidx]))
-                            if texcoords is not None:
-                                glTexCoord2fv((GLfloat * 2)(*texcoords[nidx]))
-
-                            nidx += 1
-
-                            v = prim.vertex[vidx]
-                            glVertex3fv((GLfloat * 3)(*v))
-
-                            # calculate max and min Z coordinate
-                            if v[2] > self.z_max:
-                                self.z_max = v[2]
-                            elif v[2] < self.z_min:
-                                self.z_min = v[2]
-        glutils.getGLError()
-        glEnd()
+                key = geometryKey(geom)
+                entry = _DISPLAY_LIST_CACHE.get(key)
+                if entry is None:
+                    list_id = glGenLists(1)
+                    glNewList(list_id, GL_COMPILE)
+                    (z_min, z_max) = self.drawGeometry(geom)
+                    glEndList()
+                    # compiling the list copied the array data out of
+                    # the buffer objects, so they are not needed anymore
+                    self.deleteBuffers()
+                    # keep the bound geometry alive so the ids in the
+                    # key cannot be reused by other objects
+                    entry = [list_id, 0, z_min, z_max, geom]
+                    _DISPLAY_LIST_CACHE[key] = entry
+                entry[1] += 1
+                self.geomkeys.append(key)
+
+                self.z_min = min(self.z_min, entry[2])
+                self.z_max = max(self.z_max, entry[3])
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def resolveEffect(self, effect):
+        """Return the GL material parameters and texture id for an effect.
+        Results are cached, as many primitives usually share an effect."""
+        key = id(effect)
+        if key in self.effects:
+            return self.effects[key]
+
+        diff_color = _DEFAULT_DIFFUSE
+        spec_color = None
+        shininess = None
+        amb_color = None
+        tex_id = None
+        for prop in effect.supported:
+            value = getattr(effect, prop)
+            # it can be a float, a color (tuple) or a Map
+            # ( a texture )
+            if isinstance(value, collada.material.Map):
+                colladaimage = value.sampler.surface.image
+                # textures are created up front by createTextures()
+                if colladaimage.id in self.textures:
+                    tex_id = self.textures[colladaimage.id]
+                else:
+                    print('  %s = Texture %s: (not available)' % (
+                        prop, colladaimage.id))
+            else:
+                if prop == 'diffuse' and value is not None:
+                    diff_color = colorArray(value)
+                elif prop == 'specular' and value is not None:
+                    spec_color = colorArray(value)
+                elif prop == 'ambient' and value is not None:
+                    amb_color = colorArray(value)
+                elif prop == 'shininess' and value is not None:
+                    shininess = (GLfloat * 1)(value)
+
+        self.effects[key] = (diff_color, spec_color, amb_color, shininess, tex_id)
+        return self.effects[key]
+
+    def drawGeometry(self, geom):
+        """Draw the primitives of a geometry, returning its Z range"""
+        z_max = -100000.0
+        z_min = 100000.0
+        for prim in geom.primitives():
+            (diff_color, spec_color, amb_color, shininess, tex_id) = self.resolveEffect(prim.material.effect)
+
+            # use primitive-specific ways to get triangles
+            triangles = glutils.getTriangles(prim)
+            if triangles is None or len(triangles) == 0:
+                continue
+
+            # decide once per primitive whether it is drawn textured;
+            # without texture coordinates there is nothing to map
+            textured = tex_id is not None and len(triangles.texcoordset) > 0
+            glBindTexture(GL_TEXTURE_2D, tex_id if textured else 0)
+
+            # the material is the same for the whole primitive
+            if diff_color is not None:
+                glMaterialfv(GL_FRONT, GL_DIFFUSE, diff_color)
+            if spec_color is not None:
+                glMaterialfv(GL_FRONT, GL_SPECULAR, spec_color)
+            if amb_color is not None:
+                glMaterialfv(GL_FRONT, GL_AMBIENT, amb_color)
+            if shininess is not None:
+                glMaterialfv(GL_FRONT, GL_SHININESS, shininess)
+
+            if triangles.normal is None:
+                triangles.generateNormals()
+
+            # COLLADA indexes every attribute separately. Give
+            # each distinct (vertex, normal, texcoord) corner
+            # a single index so the mesh can be drawn indexed.
+            columns = [triangles.vertex_index.ravel(), triangles.normal_index.ravel()]
+            if textured:
+                columns.append(triangles.texcoord_indexset[0].ravel())
+            corners, indices = numpy.unique(numpy.column_stack(columns), axis=0, return_inverse=True)
+            indices = indices.ravel().astype(numpy.uint32)
+
+            vertices = triangles.vertex[corners[:, 0]].astype(numpy.float32, copy=False)
+            normals = triangles.normal[corners[:, 1]].astype(numpy.float32, copy=False)
+            if textured:
+                texcoords = triangles.texcoordset[0][corners[:, 2]].astype(numpy.float32, copy=False)
+
+            # calculate max and min Z coordinate over the
+            # shared vertices rather than every triangle corner
+            zs = triangles.vertex[:, 2]
+            z_max = max(z_max, float(zs.max()))
+            z_min = min(z_min, float(zs.min()))
+
+            # upload the attributes and draw them with one call
+            glBindBuffer(GL_ARRAY_BUFFER, self.createBuffer(vertices))
+            glVertexPointer(3, GL_FLOAT, 0, None)
+            glBindBuffer(GL_ARRAY_BUFFER, self.createBuffer(normals))
+            glNormalPointer(GL_FLOAT, 0, None)
+            if textured:
+                glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+                glBindBuffer(GL_ARRAY_BUFFER, self.createBuffer(texcoords))
+                glTexCoordPointer(2, GL_FLOAT, 0, None)
+
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.createBuffer(indices, GL_ELEMENT_ARRAY_BUFFER))
+            glDrawElements(GL_TRIANGLES, len(indices), GL_UNSIGNED_INT, None)
+
+            if textured:
+                glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+            glutils.getGLError()
+
+        return (z_min, z_max)
+
+    def createBuffer(self, data, target=GL_ARRAY_BUFFER):
+        """Upload an array into a new static buffer object, which is
+        deleted again by deleteBuffers()"""
+        # hand the array memory to GL directly; it is copied into the
+        # buffer before glBufferData returns
+        data = numpy.ascontiguousarray(data)
+        vbo = GLuint()
+        glGenBuffers(1, ctypes.byref(vbo))
+        glBindBuffer(target, vbo.value)
+        glBufferData(target, data.nbytes, data.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW)
+        self.buffers.append(vbo.value)
+        return vbo.value
+
+    def deleteBuffers(self):
+        """Delete the buffer objects created by createBuffer()"""
+        if self.buffers:
+            glDeleteBuffers(len(self.buffers), (GLuint * len(self.buffers))(*self.buffers))
+            self.buffers = []
 
     def render(self, rotate_x, rotate_y, rotate_z):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -175,10 +316,8 @@ class OldStyleRenderer:
             gluPerspective(100, self.window.width / self.window.height, 1.0, 5000.0)
         glMatrixMode(GL_MODELVIEW)  # Select The Model View Matrix
         glLoadIdentity()
-        z_offset = self.z_min - (self.z_max - self.z_min) * 3
-        light_pos = (GLfloat * 3)(100.0, 100.0, 100.0 * -z_offset)
-        glLightfv(GL_LIGHT0, GL_POSITION, light_pos)
-        glTranslatef(0, 0, z_offset)
+        glLightfv(GL_LIGHT0, GL_POSITION, self.light_pos)
+        glTranslatef(0, 0, self.z_offset)
         glRotatef(rotate_x, 1.0, 0.0, 0.0)
         glRotatef(rotate_y, 0.0, 1.0, 0.0)
         glRotatef(rotate_z, 0.0, 0.0, 1.0)
@@ -189,3 +328,17 @@ class OldStyleRenderer:
     def cleanup(self):
         print('Renderer cleaning up')
         glDeleteLists(self.displist, 1)
+        for key in self.geomkeys:
+            entry = _DISPLAY_LIST_CACHE[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                glDeleteLists(entry[0], 1)
+                del _DISPLAY_LIST_CACHE[key]
+        self.geomkeys = []
+        for key in self.texkeys:
+            entry = _TEXTURE_CACHE[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                glDeleteTextures(1, ctypes.byref(GLuint(entry[0])))
+                del _TEXTURE_CACHE[key]
+        self.texkeys = []
@@ -1,14 +1,30 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
+import os
+import weakref
+from collections import OrderedDict
+import collada
+import numpy
 import pyglet
 from pyglet.gl import *
 import ctypes
 
+# glGetError() stalls the GL pipeline, so only query it when asked
+# to by setting DAEVIEW_DEBUG_GL in the environment
+DEBUG_GL = bool(os.environ.get('DAEVIEW_DEBUG_GL'))
+
+
+# ctypes array types by length, as creating them is not cheap
+_VECF_TYPES = dict((n, GLfloat * n) for n in range(1, 17))
+
 
 def VecF(*args):
     """Simple function to create ctypes arrays of floats"""
-    return (GLfloat * len(args))(*args)
+    n = len(args)
+    if n not in _VECF_TYPES:
+        _VECF_TYPES[n] = GLfloat * n
+    return _VECF_TYPES[n](*args)
 
 
 def getOpenGLVersion():
@@ -18,6 +34,8 @@ def getOpenGLVersion():
 
 
 def getGLError():
+    if not DEBUG_GL:
+        return None
     e = glGetError()
     if e != 0:
         errstr = gluErrorString(e)
@@ -25,3 +43,46 @@ def getGLError():
         return errstr
     else:
         return None
+
+
+# Decoded texture data shared by all renderer instances, so reloading
+# a scene does not decode the same images again. Entries are keyed by
+# weak references to the collada images themselves, since image ids and
+# paths are only unique within one document, and are dropped when the
+# image is garbage collected or when more than TEX_DECODE_CACHE_SIZE
+# images have been decoded since it was last used.
+TEX_DECODE_CACHE_SIZE = 32
+_TEX_DECODE_CACHE = OrderedDict()
+
+
+def _forgetImage(ref):
+    _TEX_DECODE_CACHE.pop(ref, None)
+
+
+def decodeImage(colladaimage, img):
+    """Return (width, height, RGBA pixel array) for a collada image"""
+    key = weakref.ref(colladaimage, _forgetImage)
+    entry = _TEX_DECODE_CACHE.pop(key, None)
+    if entry is None:
+        # convert() synthesizes an alpha channel if there is none,
+        # and the rows are flipped since GL expects the bottom row
+        # first
+        tex_data = numpy.ascontiguousarray(numpy.asarray(img.convert("RGBA"))[::-1])
+        entry = (img.size[0], img.size[1], tex_data)
+    # (re)insert as the most recently used entry
+    _TEX_DECODE_CACHE[key] = entry
+    if len(_TEX_DECODE_CACHE) > TEX_DECODE_CACHE_SIZE:
+        _TEX_DECODE_CACHE.popitem(last=False)
+    return entry
+
+
+def getTriangles(prim):
+    """Return a bound primitive as a bound triangle set, or None if it
+    cannot be triangulated. Subclasses such as BoundPolygons are
+    handled like their base class."""
+    if isinstance(prim, collada.triangleset.BoundTriangleSet):
+        return prim
+    if isinstance(prim, collada.polylist.BoundPolylist):
+        return prim.triangleset()
+    print('Unsupported mesh used:', type(prim).__name__)
+    return None
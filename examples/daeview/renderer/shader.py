@@ -6,7 +6,11 @@
 #
 
 from pyglet.gl import *
+from pyglet.gl import gl_info
 import ctypes
+import hashlib
+import os
+import struct
 
 
 def _as_bytes(s):
@@ -15,6 +19,22 @@ def _as_bytes(s):
     return s.encode('utf-8')
 
 
+# linked programs are cached here between runs, as driver-specific
+# binaries, when the driver supports GL_ARB_get_program_binary
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'daeview')
+
+
+def haveProgramBinary():
+    # pyglet defines the glProgramBinary entry points whatever the
+    # driver supports, so ask the current context instead
+    return gl_info.have_extension('GL_ARB_get_program_binary') or gl_info.have_version(4, 1)
+
+
+# glUniform* functions indexed by the number of values they take
+_UNIFORM_F = (None, glUniform1f, glUniform2f, glUniform3f, glUniform4f)
+_UNIFORM_I = (None, glUniform1i, glUniform2i, glUniform3i, glUniform4i)
+
+
 class Shader:
     # vert, frag and geom take arrays of source strings
     # the arrays will be concatenated into one string by OpenGL
@@ -23,6 +43,29 @@ class Shader:
         self.handle = glCreateProgram()
         # we are not linked yet
         self.linked = False
+        # uniform locations looked up so far, by name
+        self.locations = {}
+
+        # try the binary cached by an earlier run first
+        cache_path = None
+        if haveProgramBinary():
+            digest = hashlib.sha1()
+            for strings in (vert, frag, geom):
+                for s in strings:
+                    digest.update(_as_bytes(s))
+                digest.update(b'\0')
+            cache_path = os.path.join(CACHE_DIR, digest.hexdigest() + '.bin')
+            try:
+                if self.loadBinary(cache_path):
+                    return
+                # ask the driver to keep the binary around for saveBinary()
+                glProgramParameteri(self.handle, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+            except Exception:
+                # the binary path is broken on this driver; start over
+                # with a fresh program compiled from source
+                glDeleteProgram(self.handle)
+                self.handle = glCreateProgram()
+                cache_path = None
 
         # create the vertex shader
         self.createShader(vert, GL_VERTEX_SHADER)
@@ -34,6 +77,52 @@ class Shader:
         # attempt to link the program
         self.link()
 
+        if self.linked and cache_path is not None:
+            try:
+                self.saveBinary(cache_path)
+            except Exception:
+                # the cache is only an optimization
+                pass
+
+    def loadBinary(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return False
+        # the file holds the binary format enum followed by the binary
+        if len(data) <= 4:
+            return False
+        (format,) = struct.unpack('<I', data[:4])
+        binary = data[4:]
+        glProgramBinary(self.handle, format, binary, len(binary))
+
+        temp = ctypes.c_int(0)
+        # a driver update may reject binaries it created before
+        glGetProgramiv(self.handle, GL_LINK_STATUS, ctypes.byref(temp))
+        if not temp:
+            return False
+        self.linked = True
+        return True
+
+    def saveBinary(self, path):
+        length = ctypes.c_int(0)
+        glGetProgramiv(self.handle, GL_PROGRAM_BINARY_LENGTH, ctypes.byref(length))
+        if length.value <= 0:
+            return
+        buffer = ctypes.create_string_buffer(length.value)
+        format = GLenum(0)
+        glGetProgramBinary(self.handle, length, None, ctypes.byref(format), buffer)
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            with open(path, 'wb') as f:
+                f.write(struct.pack('<I', format.value))
+                f.write(buffer.raw)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
+
     def createShader(self, strings, type):
         count = len(strings)
         # if we have no source code, ignore this shader
@@ -92,6 +181,8 @@ class Shader:
         else:
             # all is well, so we are linked
             self.linked = True
+            # uniform locations are only valid for one link
+            self.locations = {}
 
     def bind(self):
         # bind the program
@@ -102,39 +193,41 @@ class Shader:
         # so this should probably be a class method instead
         glUseProgram(0)
 
+    # retrieve the location of a uniform, asking the driver only
+    # the first time each name is used
+    def uniformLocation(self, name):
+        loc = self.locations.get(name)
+        if loc is None:
+            loc = self.locations[name] = glGetUniformLocation(self.handle, name)
+        return loc
+
     # upload a floating point uniform
     # this program must be currently bound
     def uniformf(self, name, *vals):
         name = _as_bytes(name)
         # check there are 1-4 values
-        if len(vals) in range(1, 5):
-            # select the correct function
-            {1: glUniform1f,
-             2: glUniform2f,
-             3: glUniform3f,
-             4: glUniform4f
-             # retrieve the uniform location, and set
-             }[len(vals)](glGetUniformLocation(self.handle, name), *vals)
+        n = len(vals)
+        if 1 <= n <= 4:
+            # select the correct function, retrieve the uniform
+            # location, and set
+            _UNIFORM_F[n](self.uniformLocation(name), *vals)
 
     # upload an integer uniform
     # this program must be currently bound
     def uniformi(self, name, *vals):
         name = _as_bytes(name)
         # check there are 1-4 values
-        if len(vals) in range(1, 5):
-            # select the correct function
-            {1: glUniform1i,
-             2: glUniform2i,
-             3: glUniform3i,
-             4: glUniform4i
-             # retrieve the uniform location, and set
-             }[len(vals)](glGetUniformLocation(self.handle, name), *vals)
+        n = len(vals)
+        if 1 <= n <= 4:
+            # select the correct function, retrieve the uniform
+            # location, and set
+            _UNIFORM_I[n](self.uniformLocation(name), *vals)
 
     # upload a uniform matrix
     # works with matrices stored as lists,
     # as well as euclid matrices
     def uniform_matrixf(self, name, mat):
         # obtain the uniform location
-        loc = glGetUniformLocation(self.Handle, name)
+        loc = self.uniformLocation(_as_bytes(name))
         # upload the 4x4 floating point matrix
         glUniformMatrix4fv(loc, 1, False, (c_float * 16)(*mat))
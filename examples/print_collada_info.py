@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import collada
+import numpy
 import sys
 
 
@@ -14,12 +15,11 @@ def inspectController(controller):
 
 def inspectGeometry(obj):
     """Display contents of a geometry object found in the scene."""
-    materials = set()
-    for prim in obj.primitives():
-        materials.add(prim.material)
+    prims = list(obj.primitives())
+    materials = set(prim.material for prim in prims)
 
     print('    Geometry (id=%s): %d primitives' % (obj.original.id, len(obj)))
-    for prim in obj.primitives():
+    for prim in prims:
         print('        Primitive (type=%s): len=%d vertices=%d' % (type(prim).__name__, len(prim), len(prim.vertex)))
     for mat in materials:
         if mat:
@@ -47,25 +47,50 @@ def inspectMaterial(mat):
             print('            %s =' % (prop), value)
 
 
+# scene leaf node classes and the object type they bind to
+LEAF_TYPES = ((collada.scene.GeometryNode, 'geometry'),
+              (collada.scene.ControllerNode, 'controller'),
+              (collada.scene.CameraNode, 'camera'),
+              (collada.scene.LightNode, 'light'))
+
+
+def collectObjects(node, matrix, found):
+    """Bind every object under `node` into the `found` lists by type.
+
+    This is equivalent to calling scene.objects() once per type, but
+    walks the node hierarchy only once."""
+    if isinstance(node, collada.scene.NodeNode):
+        collectObjects(node.node, matrix, found)
+    elif isinstance(node, collada.scene.Node):
+        M = node.matrix if matrix is None else numpy.dot(matrix, node.matrix)
+        for child in node.children:
+            collectObjects(child, M, found)
+    else:
+        for cls, tipo in LEAF_TYPES:
+            if isinstance(node, cls):
+                found[tipo].extend(node.objects(tipo, matrix))
+
+
 def inspectCollada(col):
+    found = dict((tipo, []) for cls, tipo in LEAF_TYPES)
+    if col.scene is not None:
+        for node in col.scene.nodes:
+            collectObjects(node, None, found)
+
     # Display the file contents
     print('File Contents:')
     print('  Geometry:')
-    if col.scene is not None:
-        for geom in col.scene.objects('geometry'):
-            inspectGeometry(geom)
+    for geom in found['geometry']:
+        inspectGeometry(geom)
     print('  Controllers:')
-    if col.scene is not None:
-        for controller in col.scene.objects('controller'):
-            inspectController(controller)
+    for controller in found['controller']:
+        inspectController(controller)
     print('  Cameras:')
-    if col.scene is not None:
-        for cam in col.scene.objects('camera'):
-            print('    Camera %s: ' % cam.original.id)
+    for cam in found['camera']:
+        print('    Camera %s: ' % cam.original.id)
     print('  Lights:')
-    if col.scene is not None:
-        for light in col.scene.objects('light'):
-            print('    Light %s: color =' % light.original.id, light.color)
+    for light in found['light']:
+        print('    Light %s: color =' % light.original.id, light.color)
 
     if not col.errors:
         print('File read without errors')
@@ -79,6 +104,6 @@ if __name__ == '__main__':
     filename = sys.argv[1] if len(sys.argv) > 1 else 'misc/base.zip'
 
     # open COLLADA file ignoring some errors in case they appear
-    col = collada.Collada(filename, ignore=[collada.DaeUnsupportedError,
+    col = collada.Collada(filename, ignore=[collada.common.DaeUnsupportedError,
                                             collada.DaeBrokenRefError])
     inspectCollada(col)
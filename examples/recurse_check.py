@@ -4,12 +4,192 @@ import os.path
 import traceback
 import time
 import argparse
+import hashlib
+import json
+import multiprocessing
+import signal
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import pathname2url
 
 try:
     import collada
 except BaseException:
     sys.exit("Could not find pycollada library.")
 
+# results of previous runs, keyed by path, file modification stamp and
+# a digest of the code that checked the file (see code_version())
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'pycollada', 'recurse_check.sqlite')
+
+# number of file reports to buffer before flushing stdout
+FLUSH_EVERY = 64
+
+# number of fresh results to record before committing the result cache
+COMMIT_EVERY = 64
+
+# read-only connection to the result cache used by load_file(), and the
+# code_version() its entries must match
+_cache = None
+_cache_version = None
+
+
+def scan_directory(directory):
+    """Return the COLLADA files and the subdirectories directly inside
+    `directory`. os.scandir() reports entry types from the directory read
+    itself, so no extra stat is needed per entry."""
+    files = []
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.name.lower().endswith(('.dae', '.zip')) and entry.is_file():
+                files.append(entry.path)
+    return files, subdirectories
+
+
+def find_collada_files(directory):
+    """Recursively find COLLADA files under `directory`, scanning
+    subdirectories concurrently so slow directory reads overlap.
+
+    Files are yielded as soon as their directory has been read, so
+    loading can start before the whole tree has been walked."""
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = [executor.submit(scan_directory, directory)]
+        while pending:
+            files, subdirectories = pending.pop().result()
+            pending.extend(executor.submit(scan_directory, subdirectory)
+                           for subdirectory in subdirectories)
+            for path in files:
+                yield path
+
+
+def code_version():
+    """Return a digest of the pycollada sources, this script and the XML
+    backend in use. Cached results are only reused while it is unchanged,
+    so editing the library invalidates them even if its version is not
+    bumped."""
+    digest = hashlib.sha1()
+    digest.update(('%s %s' % (sys.version, collada.xmlutil.HAVE_LXML)).encode('utf-8'))
+    paths = [os.path.abspath(__file__)]
+    package_dir = os.path.dirname(os.path.abspath(collada.__file__))
+    for (dirpath, dirnames, filenames) in os.walk(package_dir):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if name.endswith('.py'))
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def open_cache(cache_path):
+    """Open the result cache at `cache_path`, creating it if necessary."""
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    cache = sqlite3.connect(cache_path)
+    # let pool workers read while the parent process writes
+    cache.execute('PRAGMA journal_mode=WAL')
+    cache.execute('CREATE TABLE IF NOT EXISTS results ('
+                  'path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, '
+                  'version TEXT, status TEXT, seconds REAL, details TEXT)')
+    cache.commit()
+    return cache
+
+
+def init_cache(cache_path, version):
+    """Make load_file() consult the result cache at `cache_path`, reusing
+    only results recorded by code matching `version`."""
+    global _cache, _cache_version
+    if cache_path is not None:
+        _cache = sqlite3.connect('file:%s?mode=ro' % pathname2url(cache_path), uri=True)
+        _cache_version = version
+
+
+def init_worker(cache_path, version):
+    """Pool initializer: leave Ctrl-C handling to the parent process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_cache(cache_path, version)
+
+
+def store_result(cache, version, result):
+    """Record a fresh load_file() result in the result cache."""
+    (path, status, seconds, details, stamp, cached) = result
+    (mtime, size) = stamp
+    cache.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (path, mtime, size, version, status, seconds, json.dumps(details)))
+
+
+def load_file(path):
+    """Load and sanity check a single COLLADA file.
+
+    Returns a (path, status, seconds, details, stamp, cached) tuple, where
+    status is one of 'SUCCESS', 'WARNINGS' or 'ERROR'. For warnings,
+    details is the total warning count and a list of (type name, first
+    warning, count) tuples; for errors it is the formatted traceback.
+    stamp is the (mtime, size) of the file if the result may be stored in
+    the result cache, or None otherwise. cached is True if the result was
+    taken from the cache because neither the file nor the checking code
+    changed since it was recorded.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        # the file went away or became unreadable after it was found
+        return path, 'ERROR', 0.0, traceback.format_exc(), None, False
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _cache is not None:
+        row = _cache.execute('SELECT status, seconds, details FROM results '
+                             'WHERE path = ? AND mtime = ? AND size = ? AND version = ?',
+                             (path, stamp[0], stamp[1], _cache_version)).fetchone()
+        if row is not None:
+            (status, seconds, details) = row
+            return path, status, seconds, json.loads(details), None, True
+
+    start_time = time.perf_counter()
+
+    try:
+        col = collada.Collada(path,
+                              ignore=[collada.common.DaeUnsupportedError, collada.DaeBrokenRefError])
+
+        # do some sanity checks looping through result
+        if not col.scene is None:
+            for geom in col.scene.objects('geometry'):
+                for prim in geom.primitives():
+                    assert(len(prim) >= 0)
+            for cam in col.scene.objects('camera'):
+                assert(cam.original.id)
+
+        if len(col.errors) > 0:
+            status = 'WARNINGS'
+            counts = Counter()
+            first = {}
+            for err in col.errors:
+                e = type(err).__name__
+                counts[e] += 1
+                first.setdefault(e, err)
+            type_cts = [(e, str(first[e]), ct) for e, ct in counts.items()]
+            details = (len(col.errors), type_cts)
+        else:
+            status = 'SUCCESS'
+            details = None
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as ex:
+        status = 'ERROR'
+        details = traceback.format_exc()
+        # only errors pycollada reports about the document itself are
+        # a property of the file; anything else (a bug, running out of
+        # memory, a failed read) may not happen next time
+        if not isinstance(ex, collada.DaeError):
+            stamp = None
+
+    end_time = time.perf_counter()
+    return path, status, end_time - start_time, details, stamp, False
+
 
 def main():
 
@@ -26,82 +206,104 @@ def main():
                         help='Print a summary at the end of how many files had warnings and errors')
     parser.add_argument('--zip', '-z', default=False, action='store_true',
                         help='Include .zip files when searching for files to load')
+    parser.add_argument('--jobs', '-j', type=int,
+                        default=max(1, multiprocessing.cpu_count() - 1),
+                        help='Number of files to load in parallel (default: one less than the number of CPUs)')
+    parser.add_argument('--sorted', default=False, action='store_true',
+                        help='Find all files first and load them in sorted order, instead of '
+                             'loading files as they are found')
+    parser.add_argument('--cache', default=False, action='store_true',
+                        help='Reuse results of previous runs for files unchanged since then, '
+                             'as long as pycollada and this script are unchanged too. '
+                             'Results are kept in %s' % CACHE_PATH)
 
     args = parser.parse_args()
 
     if not os.path.isdir(args.directory):
         sys.exit("Given path '%s' is not a directory." % args.directory)
 
-    directories = [args.directory]
-    collada_files = []
-    while len(directories) > 0:
-        directory = directories.pop()
-        for name in os.listdir(directory):
-            fullpath = os.path.join(directory, name)
-            (root, ext) = os.path.splitext(fullpath)
-            if os.path.isfile(fullpath) and ext.lower() == ".dae":
-                collada_files.append(fullpath)
-            elif os.path.isfile(fullpath) and ext.lower() == ".zip":
-                collada_files.append(fullpath)
-            elif os.path.isdir(fullpath):
-                directories.append(fullpath)
-
-    collada_files.sort()
+    collada_files = find_collada_files(args.directory)
+    if args.sorted:
+        collada_files = sorted(collada_files)
 
     file_success_count = 0
     file_warning_count = 0
     file_error_count = 0
 
-    for c in collada_files:
-        (root, leaf) = os.path.split(c)
-        print("'%s'..." % leaf,)
-        sys.stdout.flush()
+    if args.cache:
+        cache_path = CACHE_PATH
+        cache = open_cache(cache_path)
+        version = code_version()
+    else:
+        cache_path = cache = version = None
+    stored = 0
+
+    pool = None
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, initializer=init_worker, initargs=(cache_path, version))
+        if args.sorted:
+            results = pool.imap(load_file, collada_files, chunksize=8)
+        else:
+            results = pool.imap_unordered(load_file, collada_files)
+    else:
+        init_cache(cache_path, version)
+        results = map(load_file, collada_files)
 
-        start_time = time.time()
+    try:
+        for (i, result) in enumerate(results, 1):
+            (c, status, seconds, details, stamp, cached) = result
+            if cache is not None and stamp is not None:
+                store_result(cache, version, result)
+                stored += 1
+                if stored % COMMIT_EVERY == 0:
+                    cache.commit()
 
-        try:
-            col = collada.Collada(c,
-                                  ignore=[collada.DaeUnsupportedError, collada.DaeBrokenRefError])
+            (root, leaf) = os.path.split(c)
+            print("'%s'..." % leaf,)
 
-            if len(col.errors) > 0:
-                print("WARNINGS:", len(col.errors))
+            if status == 'WARNINGS':
+                (count, type_cts) = details
+                print("WARNINGS:", count)
                 file_warning_count += 1
-                err_names = [type(e).__name__ for e in col.errors]
-                unique = set(err_names)
-                type_cts = [(e, err_names.count(e)) for e in unique]
                 if args.show_warnings:
-                    for e, ct in type_cts:
-                        for err in col.errors:
-                            if type(err).__name__ == e:
-                                print("   %s" % str(err))
-                                break
+                    for e, err, ct in type_cts:
+                        print("   %s" % err)
                         if ct > 1:
                             print("   %s: %d additional warnings of this type" % (e, ct - 1))
-            else:
+            elif status == 'SUCCESS':
                 print("SUCCESS")
                 file_success_count += 1
+            else:
+                print("ERROR")
+                file_error_count += 1
+                if args.show_errors:
+                    print()
+                    # keep the traceback next to the file it belongs to
+                    sys.stdout.flush()
+                    sys.stderr.write(details)
+                    print()
+
+            if args.show_time:
+                if cached:
+                    print("   Unchanged since a previous run, which loaded it in %.3f seconds" % seconds)
+                else:
+                    print("   Loaded in %.3f seconds" % seconds)
+            if i % FLUSH_EVERY == 0:
+                sys.stdout.flush()
+    except (KeyboardInterrupt, SystemExit):
+        if pool is not None:
+            pool.terminate()
+        if cache is not None:
+            cache.commit()
+        print()
+        sys.exit("Keyboard interrupt. Exiting.")
 
-            # do some sanity checks looping through result
-            if not col.scene is None:
-                for geom in col.scene.objects('geometry'):
-                    for prim in geom.primitives():
-                        assert(len(prim) >= 0)
-                for cam in col.scene.objects('camera'):
-                    assert(cam.original.id)
-        except (KeyboardInterrupt, SystemExit):
-            print()
-            sys.exit("Keyboard interrupt. Exiting.")
-        except BaseException:
-            print("ERROR")
-            file_error_count += 1
-            if args.show_errors:
-                print()
-                traceback.print_exc()
-                print()
-
-        end_time = time.time()
-        if args.show_time:
-            print("   Loaded in %.3f seconds" % (end_time - start_time))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if cache is not None:
+        cache.commit()
+        cache.close()
 
     if args.show_summary:
         print()